@@ -7,8 +7,9 @@ from awsglue.job import Job
 from pyspark.sql import functions as F
 from pyspark.sql.types import *
 import boto3
+from botocore.config import Config
+import functools
 import json
-import re
 from datetime import datetime
 
 args = getResolvedOptions(sys.argv, ['JOB_NAME','ENV','BRONZE_BUCKET','SILVER_BUCKET','JOIN_MAP_SSM_KEY'])
@@ -18,8 +19,17 @@ spark = glueContext.spark_session
 job = Job(glueContext)
 job.init(args['JOB_NAME'], args)
 
-s3 = boto3.client('s3')
-ssm = boto3.client('ssm')
+# shared session + memoized clients (avoids re-parsing service models);
+# keep-alive reuses connections across calls
+_session = boto3.session.Session()
+_CLIENT_CONFIG = Config(tcp_keepalive=True, retries={"max_attempts": 3, "mode": "adaptive"})
+
+@functools.lru_cache(maxsize=None)
+def _client(service):
+    return _session.client(service, config=_CLIENT_CONFIG)
+
+s3 = _client('s3')
+ssm = _client('ssm')
 
 env = args['ENV']
 bronze_bucket = args['BRONZE_BUCKET']
@@ -34,60 +44,67 @@ if args.get('JOIN_MAP_SSM_KEY'):
     except Exception as e:
         print("No join map found or parse error:", e)
 
-# simple helper to list objects in a prefix
+# simple helper to list objects in a prefix (built-in paginator handles
+# continuation tokens and prefetches pages for us)
 def list_s3_keys(bucket, prefix):
-    keys=[]
-    kwargs = {'Bucket': bucket, 'Prefix': prefix}
-    while True:
-        resp = s3.list_objects_v2(**kwargs)
-        for obj in resp.get('Contents',[]):
-            keys.append(obj['Key'])
-        token = resp.get('NextContinuationToken')
-        if not token:
-            break
-        kwargs['ContinuationToken'] = token
+    keys = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
     return keys
 
+# each source lands in Bronze in a known format (AppFlow writes JSON,
+# DMS S3 targets write CSV), so read it directly instead of probing
 sources = {
-    "hubspot": "hubspot/",
-    "bigquery": "bigquery/",
-    "rds": "rds/"
+    "hubspot": {"prefix": "hubspot/", "format": "json"},
+    "bigquery": {"prefix": "bigquery/", "format": "json"},
+    "rds": {"prefix": "rds/", "format": "csv"}
 }
 
+def read_bronze(path, fmt):
+    if fmt == "json":
+        return spark.read.json(path)
+    if fmt == "csv":
+        return spark.read.option("header", True).csv(path)
+    return spark.read.option("recursiveFileLookup", "true").parquet(path)
+
 ingest_date = datetime.utcnow().strftime('%Y-%m-%d')
 
-for src_name, prefix in sources.items():
-    s3_path = f"s3://{bronze_bucket}/{prefix}"
+for src_name, src_cfg in sources.items():
+    s3_path = f"s3://{bronze_bucket}/{src_cfg['prefix']}"
     print("Processing source:", src_name, s3_path)
-    # Read Bronze (attempt to infer format automatically)
+    # Read Bronze in the source's declared format
     try:
-        df = spark.read.option("recursiveFileLookup","true").parquet(s3_path)
+        df = read_bronze(s3_path, src_cfg['format'])
     except Exception as e:
-        print("Parquet read failed, trying JSON/CSV:", e)
-        try:
-            df = spark.read.json(s3_path)
-        except:
-            try:
-                df = spark.read.option("header",True).csv(s3_path)
-            except Exception as e2:
-                print("Unable to read source:", e2)
-                continue
+        print("Unable to read source:", e)
+        continue
+
+    # a wrong format guess doesn't always throw: spark.read.json on
+    # non-JSON data yields a _corrupt_record frame instead of failing
+    if '_corrupt_record' in df.columns:
+        print("Source", src_name, "did not parse as", src_cfg['format'], "- skipping")
+        continue
 
     # basic cleanup: drop columns with all nulls, trim strings
-    # drop null columns
-    non_null_cols = [c for c in df.columns if df.filter(F.col(c).isNotNull()).limit(1).count() > 0]
+    # drop null columns: one aggregate pass instead of a Spark job per column
+    non_null_counts = df.agg(*[F.count(F.col(c)).alias(c) for c in df.columns]).first()
+    non_null_cols = [c for c in df.columns if non_null_counts[c] > 0]
     df = df.select(*non_null_cols)
 
-    # trim strings
-    for c, t in df.dtypes:
-        if t.startswith('string'):
-            df = df.withColumn(c, F.when(F.col(c).isNotNull(), F.trim(F.col(c))).otherwise(None))
+    # trim strings: one projection instead of a withColumn (and a new plan
+    # node) per column; trim already passes nulls through unchanged
+    df = df.select(*[
+        F.trim(F.col(c)).alias(c) if t.startswith('string') else F.col(c)
+        for c, t in df.dtypes
+    ])
 
     # dedupe using defined primary key or all columns
     pk_cols = []
-    # heuristics: look for id, _id, or "<source>_id"
+    # heuristics: look for id or *_id (which covers "<source>_id" too)
     for c in df.columns:
-        if re.search(r'(^id$|_id$|%s_id$)' % src_name, c, re.I):
+        name = c.lower()
+        if name == 'id' or name.endswith('_id'):
             pk_cols.append(c)
     if not pk_cols:
         # fallback to all columns
@@ -99,12 +116,18 @@ for src_name, prefix in sources.items():
     non_null_expr = F.expr(" OR ".join([f"{c} IS NOT NULL" for c in df.columns]))
     df = df.filter(non_null_expr)
 
-    # write to silver; partition by ingest_date
-    silver_path = f"s3://{silver_bucket}/{src_name}/"
-    df = df.withColumn("ingest_date", F.lit(ingest_date))
+    # write to silver under a Hive-style ingest_date=... directory; the path
+    # carries the partition value, so no literal column is materialized and
+    # overwrite only touches today's partition
+    silver_path = f"s3://{silver_bucket}/{src_name}/ingest_date={ingest_date}/"
+
+    # when a join reuses df below, persist the cleaned frame so the
+    # read/cleanup/dedupe lineage isn't recomputed for the second action
+    if src_name in join_map:
+        df = df.persist()
 
-    # coalesce to reasonable number of files: use dynamic partitioning
-    df.repartition(8).write.mode("overwrite").partitionBy("ingest_date").parquet(silver_path)
+    # coalesce to reasonable number of files
+    df.repartition(8).write.mode("overwrite").parquet(silver_path)
 
     # optionally attempt joins if join_map provided
     if src_name in join_map:
@@ -114,14 +137,18 @@ for src_name, prefix in sources.items():
         left_key = instr.get('left_key')
         right_key = instr.get('right_key')
         if other:
-            other_path = f"s3://{silver_bucket}/{other}/"
+            # read only the current partition: the Silver root keeps one
+            # snapshot per ingest_date, so reading it whole would join
+            # against every historical day's copy of each row
+            other_path = f"s3://{silver_bucket}/{other}/ingest_date={ingest_date}/"
             try:
                 df_other = spark.read.option("recursiveFileLookup","true").parquet(other_path)
                 # perform left join and write back to silver/curated join area
                 joined = df.join(df_other, df[left_key]==df_other[right_key], "left")
-                out_path = f"s3://{silver_bucket}/joined/{src_name}_{other}/"
-                joined.withColumn("ingest_date", F.lit(ingest_date)).repartition(8).write.mode("overwrite").parquet(out_path)
+                out_path = f"s3://{silver_bucket}/joined/{src_name}_{other}/ingest_date={ingest_date}/"
+                joined.repartition(8).write.mode("overwrite").parquet(out_path)
             except Exception as e:
                 print("Join attempt failed:", e)
+        df.unpersist()
 
 job.commit()